@@ -4,19 +4,102 @@ import subprocess
 import tempfile
 from pathlib import Path
 import os
-import numpy as np
+import signal
+import threading
 import time
 import shutil
+from cancellation import CANCEL_POLL_SECONDS, CancelToken, JobCancelled
+from progress import (
+    ATTEMPT_STARTED,
+    CODE_READY,
+    DEBUG_INVOKED,
+    DONE,
+    FAILED,
+    JOINED,
+    PLAN_READY,
+    RENDER_PROGRESS,
+    RENDER_STALLED,
+    RENDER_STALL_SECONDS,
+    emit,
+    parse_manim_progress
+)
 from tools import (
     create_animation_plan,
     create_manim_code,
+    create_manim_code_from_prompt,
     debug_manim_code
 )
+from render_estimator import choose_quality_within_budget, estimate_render_cost
+from render_queue import RenderWaitTimeout, discard_result, submit_render, wait_for_render
+from single_flight import normalize_key, run_single_flight
+from prompt_router import ROUTE_FUSED, ROUTE_REUSED, classify_prompt
+from example_index import add_example, find_reusable_example, find_similar_examples
+from job_history import (
+    classify_error,
+    finish_job,
+    record_attempt,
+    record_stage,
+    start_job,
+    timed_stage
+)
 
 # Define a constant for the maximum number of debug attempts.
 MAX_DEBUG_ATTEMPTS = 3
 
-def _render_manim_video(manim_code: str, attempt: int, quality: str) -> Path:
+# Downgrading the requested quality when a render is predicted to be too slow is opt-in:
+# the estimator's per-frame costs are rough, so by default the user gets what they asked for.
+AUTO_DOWNGRADE_QUALITY = os.environ.get("AUTO_DOWNGRADE_QUALITY", "0") == "1"
+
+# Predicted render time (in seconds) above which a job is downgraded to a cheaper quality,
+# when AUTO_DOWNGRADE_QUALITY is on. Kept generous so ordinary 4K scenes are not overridden.
+RENDER_TIME_BUDGET_SECONDS = 30 * 60
+
+# How long a cancelled Manim process gets to exit after SIGTERM before it is killed.
+MANIM_TERMINATE_GRACE_SECONDS = 5
+
+# Where renders run: "local" renders in this process, "queue" hands them to render
+# workers (render_worker.py) through the render queue.
+RENDER_BACKEND = os.environ.get("RENDER_BACKEND", "local")
+
+# How many Manim processes a server runs at once with the "local" backend. Jobs mostly
+# wait (on the LLM, on Manim, on an identical job), so the web app runs many of them;
+# only the CPU-heavy render itself is capped.
+MAX_LOCAL_RENDERS = 8
+_local_render_slots = threading.BoundedSemaphore(MAX_LOCAL_RENDERS)
+
+def _terminate_process_group(process: subprocess.Popen) -> None:
+    """
+    Stops a Manim process together with its children (ffmpeg, LaTeX), which run in
+    the same process group because Manim is started with `start_new_session=True`.
+    """
+    if process.poll() is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGTERM)
+        else:
+            process.terminate()
+        process.wait(timeout = MANIM_TERMINATE_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+        process.wait()
+    except ProcessLookupError:
+        # The process exited on its own in the meantime.
+        pass
+
+
+def _pump_lines(stream, handle_line) -> None:
+    """Reads a subprocess stream line by line as it is written (runs on its own thread)."""
+    for line in stream:
+        handle_line(line)
+
+
+def _render_manim_video(manim_code: str, attempt: int, quality: str,
+                        media_dir: Path = None, cancel_token: CancelToken = None,
+                        on_progress = None, animations: int = None) -> Path:
     """
     Internal helper function to save Manim code to a file and render it.
     This function is called by the main processing loop.
@@ -24,6 +107,10 @@ def _render_manim_video(manim_code: str, attempt: int, quality: str) -> Path:
     Args:
         manim_code: The Python script string to be rendered.
         attempt: The current attempt number (for logging purposes).
+        media_dir: Where Manim writes its files. Defaults to ./temp_media.
+        cancel_token: If given, the Manim process group is terminated once it is cancelled.
+        on_progress: Optional callback receiving RENDER_PROGRESS / RENDER_STALLED events.
+        animations: Expected number of animations (plays + waits), used for overall progress.
 
     Returns:
         The Path object pointing to the successfully rendered MP4 video file.
@@ -31,6 +118,7 @@ def _render_manim_video(manim_code: str, attempt: int, quality: str) -> Path:
     Raises:
         RuntimeError: If the Manim process fails, this exception is raised
                       containing the stderr output from Manim.
+        JobCancelled: If the job was cancelled while Manim was running.
     """
     
     # --- This dictionary maps the user's choice to Manim's command-line flags for quality---
@@ -57,8 +145,8 @@ def _render_manim_video(manim_code: str, attempt: int, quality: str) -> Path:
 
     # Here dir is created where all the files of manim will be stored(videos/images/logs)
     print(f"--- [Attempt {attempt}] Rendering script: {script_path} with quality '{quality}'")
-    media_dir = Path.cwd() / "temp_media"
-    media_dir.mkdir(exist_ok = True)
+    media_dir = media_dir or Path.cwd() / "temp_media"
+    media_dir.mkdir(parents = True, exist_ok = True)
 
     # Construct the command to run Manim from the command line.
     # This block builds the command-line instruction to render the video.
@@ -70,14 +158,85 @@ def _render_manim_video(manim_code: str, attempt: int, quality: str) -> Path:
 
     # This block executes the command and, if it works, finds and returns the path to the new video file.
     try:
-        # Execute the Manim command.
-        process = subprocess.run(
+        # Execute the Manim command in its own process group, so a cancel can stop
+        # Manim and everything it spawned in one go. Text mode turns the carriage returns
+        # of Manim's progress bars into line breaks, so every bar update is one line.
+        process = subprocess.Popen(
             command,
-            check=True, # This will raise CalledProcessError on a non-zero exit code.
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
-            encoding='utf-8'
+            encoding='utf-8',
+            start_new_session=True
         )
+
+        # Manim's output is read while it renders instead of being buffered until the end.
+        error_lines = []
+        last_output = time.monotonic()
+        last_frame = None
+
+        def handle_line(line: str, keep: bool) -> None:
+            nonlocal last_output, last_frame
+            last_output = time.monotonic()
+            progress = parse_manim_progress(line)
+            if progress is None:
+                if keep:
+                    error_lines.append(line)
+                return
+            # Progress bars are left out of the error output; the Debugger doesn't need them.
+            if progress != last_frame:
+                last_frame = progress
+                animation, frame, frames = progress
+                emit(
+                    on_progress, RENDER_PROGRESS,
+                    f"Rendering animation {animation + 1}" + (f"/{animations}" if animations else "")
+                    + f": frame {frame}/{frames}",
+                    attempt = attempt, animation = animation, animations = animations,
+                    frame = frame, frames = frames
+                )
+
+        readers = [
+            threading.Thread(target = _pump_lines, args = (process.stdout, lambda line: handle_line(line, False)), daemon = True),
+            threading.Thread(target = _pump_lines, args = (process.stderr, lambda line: handle_line(line, True)), daemon = True),
+        ]
+        for reader in readers:
+            reader.start()
+
+        stall_reported = False
+        while True:
+            try:
+                process.wait(timeout = CANCEL_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_token is not None and cancel_token.is_cancelled:
+                    print(f"--- [Attempt {attempt}] Render CANCELLED.")
+                    _terminate_process_group(process)
+                    for reader in readers:
+                        reader.join()
+                    raise JobCancelled("The job was cancelled while rendering.")
+
+                # A render that goes quiet for too long is probably stuck; say so early.
+                silent_for = time.monotonic() - last_output
+                if silent_for > RENDER_STALL_SECONDS and not stall_reported:
+                    print(f"--- [Attempt {attempt}] WARNING: no output from Manim for {silent_for:.0f}s.")
+                    emit(
+                        on_progress, RENDER_STALLED,
+                        f"Manim has produced no output for {silent_for:.0f}s; the render may be stuck.",
+                        attempt = attempt
+                    )
+                    stall_reported = True
+                elif silent_for <= RENDER_STALL_SECONDS:
+                    stall_reported = False
+
+        for reader in readers:
+            reader.join()
+
+        if process.returncode != 0:
+            # This is the primary failure case for broken code.
+            print(f"--- [Attempt {attempt}] Render FAILED.")
+            # Raise a new exception containing Manim's specific error message.
+            raise RuntimeError("".join(error_lines))
+
         # Find the generated video file.
         video_dir = media_dir / "videos" / script_path.stem / quality_folders[quality]
         video_files = list(video_dir.glob("*.mp4"))
@@ -88,73 +247,222 @@ def _render_manim_video(manim_code: str, attempt: int, quality: str) -> Path:
         print(f"--- [Attempt {attempt}] Render SUCCESSFUL.")
         return video_files[0]
 
-    # If Manim fails, this block catches the technical error message and passes it up the chain.
-    except subprocess.CalledProcessError as e:
-        # This is the primary failure case for broken code.
-        print(f"--- [Attempt {attempt}] Render FAILED.")
-        # Re-raise a new exception containing Manim's specific error message.
-        raise RuntimeError(e.stderr) from e
-
     finally:
         # Ensure the temporary script file is always cleaned up.
         if script_path.exists():
             os.remove(script_path)
 
 
-def process_prompt_to_video(prompt: str, quality: str) -> Path:
+def _render_video(manim_code: str, attempt: int, quality: str, job_id: str,
+                  media_dir: Path, cancel_token: CancelToken,
+                  on_progress = None, animations: int = None) -> Path:
+    """
+    Renders the code on the configured RENDER_BACKEND and returns the video's path.
+    Both backends raise RuntimeError with Manim's error output when the render fails.
+    Per-frame progress is only reported for local renders.
+    """
+    if RENDER_BACKEND == "queue":
+        render_id = f"{job_id}-{attempt}"
+        print(f"--- [Attempt {attempt}] Queued render {render_id} with quality '{quality}'")
+        submit_render(render_id, job_id, manim_code, quality)
+        video_path = wait_for_render(render_id, cancel_token)
+        print(f"--- [Attempt {attempt}] Render SUCCESSFUL.")
+        return video_path
+
+    while not _local_render_slots.acquire(timeout = CANCEL_POLL_SECONDS):
+        cancel_token.raise_if_cancelled()
+    try:
+        return _render_manim_video(
+            manim_code, attempt, quality,
+            media_dir = media_dir, cancel_token = cancel_token,
+            on_progress = on_progress, animations = animations
+        )
+    finally:
+        _local_render_slots.release()
+
+
+def process_prompt_to_video(prompt: str, quality: str, cancel_token: CancelToken = None,
+                            on_progress = None) -> Path:
     """
     This is the main entry point function for the backend.
-    It receives the user's query and orchestrates the full "Plan-and-Debug" pipeline.
+    Identical requests (same prompt up to whitespace, same quality) that arrive while
+    one is already running are attached to that job and share its result, instead of
+    paying for their own planner, coder and render. Arguments, return value and errors
+    are the same as for `_run_pipeline`.
+    """
+    return run_single_flight(
+        normalize_key(prompt, quality),
+        lambda shared_token, broadcast: _run_pipeline(prompt, quality, shared_token, broadcast),
+        cancel_token = cancel_token,
+        on_progress = on_progress,
+        on_join = lambda: emit(
+            on_progress, JOINED, "An identical request is already rendering; sharing its result."
+        )
+    )
+
+
+def _run_pipeline(prompt: str, quality: str, cancel_token: CancelToken = None,
+                  on_progress = None) -> Path:
+    """
+    Receives the user's query and orchestrates the full "Plan-and-Debug" pipeline.
 
     Args:
         prompt: The natural language animation description from the user.
+        quality: The video quality chosen by the user ("480p", "720p", ...).
+        cancel_token: If given, cancelling it stops the job's LLM calls and render.
+        on_progress: Optional callback that receives a progress.ProgressEvent at every step
+                     (plan ready, code ready, attempt started, render progress, debug, done).
+                     It is called from the thread running the job.
 
     Returns:
         The Path object to the final, successfully rendered MP4 video.
 
     Raises:
         RuntimeError: If the pipeline fails after all debug attempts.
+        JobCancelled: If the job was cancelled before it finished.
     """
     print(f"\n--- NEW JOB: PROCESSING PROMPT: '{prompt}' ---")
 
-    temp_media_dir = Path.cwd() / "temp_media"
+    cancel_token = cancel_token or CancelToken()
 
-    # === STEP 1: PLAN ===
-    # Call the Planner agent to create a detailed plan.
-    plan = create_animation_plan(prompt)
+    # === STEP 0: ROUTE ===
+    # Simple prompts don't need a storyboard, so they skip the Planner round trip.
+    route = classify_prompt(prompt)
 
-    # === STEP 2: CODE ===
-    # Call the Coder agent to generate the initial Manim script based on the plan.
-    current_code = create_manim_code(plan)
+    # Verified code stored for exactly this prompt is reused as-is, with no LLM call.
+    # Such jobs get their own route so they don't skew the fused/planned numbers.
+    reused = find_reusable_example(prompt)
+    job_route = ROUTE_REUSED if reused else route["route"]
+    print(f"--- Router: '{job_route}' route (score {route['score']}).")
+
+    # Every job and attempt is written to the job history database for analytics.
+    job_id = start_job(prompt, quality, job_route)
+    job_started = time.perf_counter()
+    attempts_made = 0
+    error_class = None
+    succeeded = False
+    cancelled = False
+
+    # Each job renders into its own folder, so concurrent jobs never touch each other's files.
+    temp_media_dir = Path.cwd() / "temp_media" / job_id
 
-    # === STEP 3: RENDER & DEBUG LOOP ===
-    # This loop will try to render the code, and if it fails, it will call the
-    # Debugger agent and try again with the corrected code.
     try:
+        # Otherwise, the closest verified examples from past jobs are shown to the Coder.
+        with timed_stage(job_id, "retrieve"):
+            examples = [] if reused else find_similar_examples(prompt)
+
+        if reused:
+            # === STEPS 1+2: reuse a verified plan & code ===
+            print("--- Example index: Reusing verified code stored for this exact prompt.")
+            plan = reused["plan"]
+            current_code = reused["code"]
+            emit(on_progress, PLAN_READY, "Found a matching verified animation; reusing its plan.")
+        elif route["route"] == ROUTE_FUSED:
+            # === STEPS 1+2: PLAN & CODE in a single call ===
+            # The prompt itself is short enough to serve as the plan for the Debugger.
+            plan = f"Animation Plan:\n1. {prompt}"
+            emit(on_progress, PLAN_READY, "Simple prompt: writing the code directly, no separate plan needed.")
+            with timed_stage(job_id, "code"):
+                current_code = create_manim_code_from_prompt(prompt, examples = examples, cancel_token = cancel_token)
+        else:
+            # === STEP 1: PLAN ===
+            # Call the Planner agent to create a detailed plan.
+            with timed_stage(job_id, "plan"):
+                plan = create_animation_plan(prompt, cancel_token = cancel_token)
+            emit(on_progress, PLAN_READY, "Animation plan ready.")
+
+            # === STEP 2: CODE ===
+            # Call the Coder agent to generate the initial Manim script based on the plan.
+            with timed_stage(job_id, "code"):
+                current_code = create_manim_code(plan, examples = examples, cancel_token = cancel_token)
+
+        emit(on_progress, CODE_READY, "Manim code ready.")
+
+        # === STEP 3: RENDER & DEBUG LOOP ===
+        # This loop will try to render the code, and if it fails, it will call the
+        # Debugger agent and try again with the corrected code.
         for attempt in range(1, MAX_DEBUG_ATTEMPTS + 1):
+            cancel_token.raise_if_cancelled()
+            attempts_made = attempt
+            render_quality = quality
             try:
+                # Admission control: estimate the render cost from the code's AST and, if
+                # enabled, step down the quality if the job would blow the time budget.
+                if AUTO_DOWNGRADE_QUALITY:
+                    render_quality, estimate = choose_quality_within_budget(
+                        current_code, quality, RENDER_TIME_BUDGET_SECONDS
+                    )
+                else:
+                    estimate = estimate_render_cost(current_code, quality)
+                if estimate is not None:
+                    print(
+                        f"--- [Attempt {attempt}] Estimated {estimate['frames']} frames, "
+                        f"~{estimate['render_seconds']:.0f}s to render at '{render_quality}'."
+                    )
+                if render_quality != quality:
+                    print(
+                        f"--- [Attempt {attempt}] WARNING: '{quality}' exceeds the "
+                        f"{RENDER_TIME_BUDGET_SECONDS}s budget, downgrading to '{render_quality}'."
+                    )
+
+                # Manim numbers every play and wait as an animation.
+                animations = estimate["play_calls"] + estimate["wait_calls"] if estimate else None
+                emit(
+                    on_progress, ATTEMPT_STARTED,
+                    f"Render attempt {attempt} of {MAX_DEBUG_ATTEMPTS} started at {render_quality}.",
+                    attempt = attempt, animations = animations,
+                    frames = estimate["frames"] if estimate else None, quality = render_quality
+                )
+
                 # Attempt to render the current version of the code.
-                temp_video_path = _render_manim_video(current_code, attempt, quality)
+                with timed_stage(job_id, "render", attempt):
+                    temp_video_path = _render_video(
+                        current_code, attempt, render_quality, job_id,
+                        media_dir = temp_media_dir, cancel_token = cancel_token,
+                        on_progress = on_progress, animations = animations
+                    )
 
                 # This block runs only on success. It copies the temporary video
                 # to a permanent location before the temp folder is deleted.
                 final_output_dir = Path.cwd() / "final_videos"
                 final_output_dir.mkdir(exist_ok=True)
                 
-                # Create a unique filename using a timestamp to prevent overwrites
-                unique_filename = f"{os.path.splitext(temp_video_path.name)[0]}_{int(time.time())}.mp4"
+                # Name the file after the job, so concurrent jobs finishing in the same
+                # second can never overwrite (and serve) each other's video.
+                unique_filename = f"{os.path.splitext(temp_video_path.name)[0]}_{job_id}.mp4"
                 final_video_path = final_output_dir / unique_filename
                 
                 # Copy the file
                 shutil.copy(temp_video_path, final_video_path)
+                if RENDER_BACKEND == "queue":
+                    discard_result(temp_video_path)
 
                 # If rendering is successful, the loop is exited and the video path is returned.
                 print("--- PIPELINE COMPLETED SUCCESSFULLY ---")
-                return final_video_path
+                record_attempt(job_id, attempt, render_quality, succeeded = True)
+                succeeded = True
+                break
+
+            except JobCancelled:
+                # Nobody is waiting for this job anymore, so don't debug or retry.
+                raise
 
             except Exception as e:
                 # This block catches the RuntimeError from the render function.
                 error_message = str(e)
+                # Manim failures arrive as a plain RuntimeError carrying Manim's output; anything
+                # else (a render queue timeout, a missing video file...) is its own class.
+                if type(e) is RuntimeError:
+                    error_class = classify_error(error_message, fallback = type(e).__name__)
+                else:
+                    error_class = type(e).__name__
+                record_attempt(job_id, attempt, render_quality, succeeded = False, error_class = error_class)
+
+                # No render worker got to the job in time; the code is not at fault, so
+                # asking the Debugger (and waiting for another render) would not help.
+                if isinstance(e, RenderWaitTimeout):
+                    raise
+
                 print(f"--- ERROR caught on attempt {attempt}. Preparing to debug.")
 
                 # === FALLBACK LOGIC ===
@@ -169,19 +477,46 @@ def process_prompt_to_video(prompt: str, quality: str) -> Path:
 
                 # If we still have attempts left, call the Debugger agent.
                 print("--- Calling Debugger LLM for a fix...")
-                current_code = debug_manim_code(
-                    plan = plan,
-                    broken_code = current_code,
-                    error_message = error_message
-                )
+                emit(on_progress, DEBUG_INVOKED, f"Attempt {attempt} failed ({error_class}); asking the Debugger for a fix.", attempt = attempt)
+                with timed_stage(job_id, "debug", attempt):
+                    current_code = debug_manim_code(
+                        plan = plan,
+                        broken_code = current_code,
+                        error_message = error_message,
+                        cancel_token = cancel_token
+                    )
                 # The loop will now continue to the next iteration with the newly corrected code.
 
+        # Success bookkeeping happens outside the render `try`, so a failure here can
+        # never send working code to the Debugger or throw away the rendered video.
+        # The code is now verified, so keep it as an example for future prompts.
+        if not (reused and current_code == reused["code"]):
+            add_example(prompt, plan, current_code)
+        emit(
+            on_progress, DONE, f"Animation rendered successfully at {render_quality}.",
+            attempt = attempts_made, quality = render_quality
+        )
+        return final_video_path
+
+    except JobCancelled:
+        print("--- JOB CANCELLED ---")
+        cancelled = True
+        raise
+
+    except Exception as e:
+        # Failures outside the render (e.g. an LLM call) are recorded by their exception type.
+        if error_class is None:
+            error_class = type(e).__name__
+        emit(on_progress, FAILED, f"The job failed: {error_class}.", attempt = attempts_made or None)
+        raise
+
     finally:
+        record_stage(job_id, "total", time.perf_counter() - job_started)
+        finish_job(job_id, succeeded, attempts_made, None if succeeded else error_class, cancelled = cancelled)
+
         # This `finally` block ensures that the temporary media directory
         # is ALWAYS deleted after the job is finished, whether it succeeded or failed.
         # The `final_videos` folder is NOT touched.
         if temp_media_dir.exists():
             print(f"--- Cleaning up temporary directory: {temp_media_dir} ---")
             shutil.rmtree(temp_media_dir)
-
-    raise RuntimeError("Exited the debug loop unexpectedly.")
@@ -0,0 +1,37 @@
+# This file provides the cancellation token that is passed through the pipeline, so a job
+# nobody is waiting for anymore stops its LLM calls and Manim render instead of finishing.
+import threading
+
+# How often blocking work (LLM calls, the Manim process) checks whether it was cancelled.
+CANCEL_POLL_SECONDS = 0.2
+
+
+class JobCancelled(Exception):
+    """Raised inside the pipeline when its job has been cancelled."""
+
+
+class CancelToken:
+    """
+    A thread-safe flag shared between whoever started a job (e.g. the web page) and the
+    pipeline running it. The owner calls `cancel()`; the pipeline checks the token between
+    stages and while waiting on LLM calls and subprocesses.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        """Raises JobCancelled if the job has been cancelled."""
+        if self.is_cancelled:
+            raise JobCancelled("The job was cancelled.")
+
+    def wait(self, timeout: float) -> bool:
+        """Sleeps for up to `timeout` seconds, waking early on cancel. Returns True if cancelled."""
+        return self._event.wait(timeout)
@@ -0,0 +1,165 @@
+# This file keeps a local index of (prompt, plan, working code) examples from past
+# successful renders, and retrieves the closest ones for new prompts (TF-IDF + cosine).
+import json
+import math
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+
+# Where verified examples are stored, one JSON object per line.
+EXAMPLE_STORE_PATH = Path.cwd() / "example_store.jsonl"
+
+# How many examples to show the Coder, and how similar they must be to be useful.
+MAX_EXAMPLES = 2
+MIN_SIMILARITY = 0.25
+
+# Very common words that say nothing about the animation itself.
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "with", "for", "from", "by",
+    "is", "it", "its", "that", "this", "as", "at", "be", "then", "please", "show",
+    "animate", "animation", "create", "make", "draw", "me", "i", "want", "video",
+}
+
+
+def _normalize(text: str) -> str:
+    """
+    Collapses whitespace so trivially different prompts compare equal. Case is kept:
+    "the text ABC" or a variable `X` vs `x` changes what the animation should show.
+    """
+    return " ".join(text.split())
+
+
+def _tokenize(text: str) -> list:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOP_WORDS]
+
+
+class _ExampleIndex:
+    """
+    In-memory TF-IDF index over the stored prompts. It is rebuilt lazily whenever the
+    store file changes on disk, so several server processes can share one store.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.loaded_mtime = None
+        self.examples = []
+        self.vectors = []
+        self.idf = {}
+        self.unseen_idf = 1.0
+
+    def _reload_if_changed(self):
+        mtime = self.path.stat().st_mtime_ns if self.path.exists() else None
+        if mtime == self.loaded_mtime:
+            return
+
+        # Later lines win, so re-verifying a prompt replaces its older example.
+        by_prompt = {}
+        if self.path.exists():
+            with open(self.path, encoding = "utf-8") as store:
+                for line in store:
+                    try:
+                        example = json.loads(line)
+                    except ValueError:
+                        continue  # Skip a half-written line instead of losing the whole index.
+                    by_prompt[_normalize(example["prompt"])] = example
+
+        self.examples = list(by_prompt.values())
+        token_counts = [Counter(_tokenize(e["prompt"])) for e in self.examples]
+
+        document_frequency = Counter()
+        for counts in token_counts:
+            document_frequency.update(counts.keys())
+        total = len(self.examples)
+        self.idf = {t: math.log((1 + total) / (1 + df)) + 1 for t, df in document_frequency.items()}
+        # Query words no stored prompt uses are as rare as a word can be (df = 0); they must
+        # still count in the query's norm, or they would silently inflate every similarity.
+        self.unseen_idf = math.log(1 + total) + 1
+        self.vectors = [self._vectorize(counts) for counts in token_counts]
+        self.loaded_mtime = mtime
+
+    def _vectorize(self, counts: Counter) -> dict:
+        vector = {t: c * self.idf.get(t, self.unseen_idf) for t, c in counts.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        return {t: v / norm for t, v in vector.items()} if norm else {}
+
+    def search(self, prompt: str, k: int) -> list:
+        with self.lock:
+            self._reload_if_changed()
+            normalized = _normalize(prompt)
+            query = self._vectorize(Counter(_tokenize(prompt)))
+
+            scored = []
+            for example, vector in zip(self.examples, self.vectors):
+                if _normalize(example["prompt"]) == normalized:
+                    score = 1.0
+                else:
+                    score = sum(weight * vector.get(t, 0.0) for t, weight in query.items())
+                scored.append((score, example))
+
+        scored.sort(key = lambda pair: pair[0], reverse = True)
+        return [dict(example, score = score) for score, example in scored[:k]]
+
+    def lookup(self, prompt: str):
+        """Returns the stored example whose prompt is the same as `prompt` after normalization, or None."""
+        with self.lock:
+            self._reload_if_changed()
+            normalized = _normalize(prompt)
+            for example in self.examples:
+                if _normalize(example["prompt"]) == normalized:
+                    return dict(example, score = 1.0)
+        return None
+
+    def add(self, example: dict):
+        with self.lock:
+            with open(self.path, "a", encoding = "utf-8") as store:
+                store.write(json.dumps(example) + "\n")
+
+
+_index = _ExampleIndex(EXAMPLE_STORE_PATH)
+
+
+def add_example(prompt: str, plan: str, code: str) -> None:
+    """
+    Stores a verified (prompt, plan, working code) triple. Only call this after the
+    code has rendered successfully. A store that can't be written is logged, never
+    allowed to fail the job that produced the example.
+    """
+    try:
+        _index.add({"prompt": prompt, "plan": plan, "code": code})
+    except OSError as e:
+        print(f"--- Example index: Could not store the example ({e}).")
+        return
+    print("--- Example index: Stored verified example.")
+
+
+def find_similar_examples(prompt: str, k: int = MAX_EXAMPLES, min_similarity: float = MIN_SIMILARITY) -> list:
+    """
+    Returns up to `k` stored examples most similar to `prompt`, best first.
+
+    Each result is the stored dictionary (`prompt`, `plan`, `code`) plus a `score`
+    between 0 and 1. Examples below `min_similarity` are left out.
+    """
+    return [e for e in _index.search(prompt, k) if e["score"] >= min_similarity]
+
+
+def find_reusable_example(prompt: str):
+    """
+    Returns the stored example for exactly this prompt (ignoring only whitespace), or None.
+    TF-IDF similarity is deliberately not used here: it ignores word order, signs and symbols,
+    so "x²" vs "x³" or "left to right" vs "right to left" would score as identical.
+    """
+    return _index.lookup(prompt)
+
+
+def format_examples(examples: list) -> str:
+    """Formats retrieved examples as a few-shot block for the Coder's prompt."""
+    blocks = []
+    for number, example in enumerate(examples, start = 1):
+        blocks.append(
+            f"--- EXAMPLE {number} ---\n"
+            f"Request: {example['prompt']}\n"
+            f"Working code:\n{example['code']}"
+        )
+    return "\n\n".join(blocks)
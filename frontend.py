@@ -2,7 +2,13 @@ import streamlit as st
 import base64
 from pathlib import Path
 import streamlit.components.v1 as components
-from backend_processor import process_prompt_to_video
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from cancellation import CancelToken, JobCancelled
+from progress import ATTEMPT_STARTED, RENDER_STALLED
+# NOTE: backend_processor is imported only when a render is requested, so a fresh
+# server process can draw the landing page without loading the LLM/rendering stack.
 
 # This gets the directory of the currently running script
 SCRIPT_DIR = Path(__file__).parent
@@ -22,11 +28,66 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ----------------- Helpers -----------------
+# Cached so the demo videos are read and base64-encoded once per server, not on every rerun.
+@st.cache_data(show_spinner = False)
 def file_to_data_uri(path: Path, mime: str) -> str:
     b = path.read_bytes()
     s = base64.b64encode(b).decode()
     return f"data:{mime};base64,{s}"
 
+# Render jobs from all sessions share one pool of worker threads per server. A job's thread
+# mostly waits (on the LLM, on Manim, or on an identical job it was attached to), so the
+# pool is large; the backend caps how many Manim renders actually run at once.
+MAX_CONCURRENT_JOBS = 64
+
+@st.cache_resource
+def job_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers = MAX_CONCURRENT_JOBS, thread_name_prefix = "manimai-job")
+
+def wait_for_job(job, cancel_token: CancelToken, events: queue.Queue, poll_seconds: float = 0.5):
+    """
+    Waits for a background job while showing its progress events. When the user submits
+    a new prompt or closes the tab, Streamlit interrupts this script at its next `st.*`
+    call; nobody will see the result anymore, so the job is cancelled instead of finishing.
+
+    Returns the quality the video was last rendered at, or None if no render started.
+    """
+    progress_bar = st.progress(0.0)
+    status = st.empty()
+    started = time.time()
+    message, fraction, stalled = "🧠 Planning the animation...", 0.0, False
+    rendered_quality = None
+    try:
+        while not job.done():
+            while not events.empty():
+                event = events.get_nowait()
+                message = event.message
+                rendered_quality = event.quality or rendered_quality
+                stalled = event.kind == RENDER_STALLED
+                if event.kind == ATTEMPT_STARTED:
+                    fraction = 0.0
+                elif event.fraction is not None:
+                    fraction = event.fraction
+            progress_bar.progress(fraction)
+            text = f"{message} · ⏱️ {int(time.time() - started)}s elapsed"
+            if stalled:
+                status.warning(text)
+            else:
+                status.caption(text)
+            time.sleep(poll_seconds)
+    finally:
+        # A job still queued in the executor is dropped before it starts; a running one
+        # is told to stop.
+        if not job.cancel() and not job.done():
+            cancel_token.cancel()
+    progress_bar.empty()
+    status.empty()
+
+    # The final events may arrive after the last poll.
+    while not events.empty():
+        rendered_quality = events.get_nowait().quality or rendered_quality
+    return rendered_quality
+
 def safe_logo_data_uri(path_str: str):
     p = Path(path_str)
     if p.exists():
@@ -492,14 +553,29 @@ with action_col1:
             elif not quality or quality == '✨ Select Quality': # Check if the placeholder is still selected
                 st.warning("Please select a video quality.")
             else:
+                from backend_processor import process_prompt_to_video
+
+                # The job runs on a worker thread so this script stays responsive to Streamlit:
+                # if it is interrupted while waiting, the job is cancelled in `wait_for_job`.
+                cancel_token = CancelToken()
+                events = queue.Queue()
+                job = job_executor().submit(process_prompt_to_video, prompt, quality, cancel_token, events.put)
+                with st.spinner("🎬 Rendering frames... Stitching the final video."):
+                    rendered_quality = wait_for_job(job, cancel_token, events)
+
                 try:
-                    with st.spinner("🎬 Rendering frames... Stitching the final video."):
-                        video_path = process_prompt_to_video(prompt, quality)
-                        
-                        # Store the successful result in session state to remember it
-                        st.session_state.video_path = video_path
-                    
-                    st.success("🎉 Animation rendered successfully!")
+                    # Store the successful result in session state to remember it
+                    st.session_state.video_path = job.result()
+                    if rendered_quality and rendered_quality != quality:
+                        st.warning(
+                            f"⚠️ Rendered at {rendered_quality} instead of {quality}: "
+                            f"{quality} was predicted to take too long."
+                        )
+                    else:
+                        st.success("🎉 Animation rendered successfully!")
+
+                except JobCancelled:
+                    st.info("The previous render was cancelled.")
 
                 except Exception as e:
                     st.error(f"An error occurred during rendering: {e}")
@@ -0,0 +1,263 @@
+# This file records every job and every render attempt in an embedded SQLite database,
+# and provides the queries behind the admin page (latency percentiles, failure rates...).
+import hashlib
+import math
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+# The database lives next to the other runtime files; SQLite needs no server.
+JOB_HISTORY_PATH = Path.cwd() / "job_history.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id        TEXT PRIMARY KEY,
+    prompt_hash   TEXT NOT NULL,
+    quality       TEXT NOT NULL,
+    route         TEXT,
+    started_at    REAL NOT NULL,
+    finished_at   REAL,
+    status        TEXT NOT NULL,            -- 'running', 'succeeded', 'failed' or 'cancelled'
+    attempts      INTEGER,
+    fixed_by      TEXT,                     -- 'first_attempt', 'debugger' or NULL
+    error_class   TEXT
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    job_id        TEXT NOT NULL,
+    attempt       INTEGER NOT NULL,
+    quality       TEXT NOT NULL,
+    succeeded     INTEGER NOT NULL,
+    error_class   TEXT,
+    recorded_at   REAL NOT NULL,
+    PRIMARY KEY (job_id, attempt)
+);
+CREATE TABLE IF NOT EXISTS stages (
+    job_id        TEXT NOT NULL,
+    attempt       INTEGER,                  -- NULL for stages that run once per job
+    stage         TEXT NOT NULL,            -- 'plan', 'code', 'render', 'debug', ...
+    seconds       REAL NOT NULL,
+    recorded_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stages_by_time ON stages (recorded_at);
+CREATE INDEX IF NOT EXISTS jobs_by_time ON jobs (started_at);
+"""
+
+
+# The WAL journal mode is stored in the database file, so setup is only needed once per process.
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+@contextmanager
+def _connect():
+    """
+    Yields a fresh connection, commits (or rolls back) when the block ends and always
+    closes it. A connection per call keeps this safe to use from Streamlit's session threads.
+    """
+    global _schema_ready
+    connection = sqlite3.connect(JOB_HISTORY_PATH, timeout = 10)
+    try:
+        with _schema_lock:
+            if not _schema_ready:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(_SCHEMA)
+                _schema_ready = True
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def _write(sql: str, params: tuple) -> None:
+    """Runs a write, but never lets a broken history database fail a user's job."""
+    try:
+        with _connect() as connection:
+            connection.execute(sql, params)
+    except sqlite3.Error as e:
+        print(f"--- Job history: Could not record ({e}).")
+
+
+def hash_prompt(prompt: str) -> str:
+    """Hashes the normalized prompt so jobs can be grouped without storing user text."""
+    return hashlib.sha256(" ".join(prompt.lower().split()).encode("utf-8")).hexdigest()[:16]
+
+
+def classify_error(error_message: str, fallback: str = "UnknownError") -> str:
+    """
+    Reduces a Manim/Python error message to its exception class, e.g. 'NameError'.
+    The last exception named in a traceback is the one that actually stopped the render.
+    Returns `fallback` (e.g. the raised exception's own type) if no class is named.
+    """
+    matches = re.findall(r"\b([A-Z][A-Za-z]*(?:Error|Exception|Exit|Interrupt))\b", error_message or "")
+    return matches[-1] if matches else fallback
+
+
+# --- Recording ---
+
+def start_job(prompt: str, quality: str, route: str = None) -> str:
+    """Records a new job as running and returns its id."""
+    job_id = uuid.uuid4().hex
+    _write(
+        "INSERT INTO jobs (job_id, prompt_hash, quality, route, started_at, status) VALUES (?, ?, ?, ?, ?, 'running')",
+        (job_id, hash_prompt(prompt), quality, route, time.time())
+    )
+    return job_id
+
+
+def record_stage(job_id: str, stage: str, seconds: float, attempt: int = None) -> None:
+    """Records how long one pipeline stage took."""
+    _write(
+        "INSERT INTO stages (job_id, attempt, stage, seconds, recorded_at) VALUES (?, ?, ?, ?, ?)",
+        (job_id, attempt, stage, seconds, time.time())
+    )
+
+
+@contextmanager
+def timed_stage(job_id: str, stage: str, attempt: int = None):
+    """Context manager that times the wrapped block and records it as `stage`, even if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(job_id, stage, time.perf_counter() - start, attempt)
+
+
+def record_attempt(job_id: str, attempt: int, quality: str, succeeded: bool, error_class: str = None) -> None:
+    """Records the outcome of one render attempt."""
+    _write(
+        "INSERT OR REPLACE INTO attempts (job_id, attempt, quality, succeeded, error_class, recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (job_id, attempt, quality, int(succeeded), error_class, time.time())
+    )
+
+
+def finish_job(job_id: str, succeeded: bool, attempts: int, error_class: str = None, cancelled: bool = False) -> None:
+    """Marks a job as finished. A success after the first attempt was fixed by the Debugger."""
+    if succeeded:
+        status = "succeeded"
+        fixed_by = "first_attempt" if attempts == 1 else "debugger"
+    else:
+        status = "cancelled" if cancelled else "failed"
+        fixed_by = None
+    _write(
+        "UPDATE jobs SET finished_at = ?, status = ?, attempts = ?, fixed_by = ?, error_class = ? WHERE job_id = ?",
+        (time.time(), status, attempts, fixed_by, None if cancelled else error_class, job_id)
+    )
+
+
+# --- Queries ---
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _since(days: float) -> float:
+    return time.time() - days * 86400 if days else 0.0
+
+
+def stage_latency_percentiles(days: float = None) -> dict:
+    """
+    Returns {stage: {"count", "p50", "p95", "total"}} in seconds, over the last
+    `days` days (or all history when `days` is None).
+    """
+    with _connect() as connection:
+        rows = connection.execute(
+            "SELECT stage, seconds FROM stages WHERE recorded_at >= ?", (_since(days),)
+        ).fetchall()
+
+    by_stage = defaultdict(list)
+    for stage, seconds in rows:
+        by_stage[stage].append(seconds)
+
+    report = {}
+    for stage, values in by_stage.items():
+        values.sort()
+        report[stage] = {
+            "count": len(values),
+            "p50": _percentile(values, 0.50),
+            "p95": _percentile(values, 0.95),
+            "total": sum(values),
+        }
+    return report
+
+
+def failure_rate_by_error(days: float = None) -> list:
+    """
+    Returns one row per error class, most frequent first, with how many render
+    attempts failed with it and what share of all attempts that is.
+    """
+    with _connect() as connection:
+        total = connection.execute(
+            "SELECT COUNT(*) FROM attempts WHERE recorded_at >= ?", (_since(days),)
+        ).fetchone()[0]
+        rows = connection.execute(
+            "SELECT error_class, COUNT(*) FROM attempts WHERE succeeded = 0 AND recorded_at >= ? "
+            "GROUP BY error_class ORDER BY COUNT(*) DESC",
+            (_since(days),)
+        ).fetchall()
+
+    return [
+        {"error_class": error_class, "failures": count, "rate": count / total if total else 0.0}
+        for error_class, count in rows
+    ]
+
+
+def debug_attempts_distribution(days: float = None) -> dict:
+    """
+    Returns how many finished jobs needed N render attempts, split by outcome:
+    {"succeeded": {1: 40, 2: 7, ...}, "failed": {3: 2}}. Cancelled jobs are left out.
+    """
+    with _connect() as connection:
+        rows = connection.execute(
+            "SELECT status, attempts FROM jobs WHERE status IN ('succeeded', 'failed') AND started_at >= ?",
+            (_since(days),)
+        ).fetchall()
+
+    distribution = {"succeeded": Counter(), "failed": Counter()}
+    for status, attempts in rows:
+        distribution[status][attempts] += 1
+    return {status: dict(sorted(counts.items())) for status, counts in distribution.items()}
+
+
+def job_summary(days: float = None) -> dict:
+    """Returns overall job counts and how successful jobs were fixed."""
+    with _connect() as connection:
+        rows = connection.execute(
+            "SELECT status, fixed_by, COUNT(*) FROM jobs WHERE started_at >= ? GROUP BY status, fixed_by",
+            (_since(days),)
+        ).fetchall()
+
+    summary = {"jobs": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "running": 0, "first_attempt": 0, "debugger": 0}
+    for status, fixed_by, count in rows:
+        summary["jobs"] += count
+        summary[status] += count
+        if fixed_by:
+            summary[fixed_by] += count
+    return summary
+
+
+def route_outcomes(days: float = None) -> list:
+    """
+    Returns one row per router route with its finished jobs, how many succeeded, the
+    share that needed the Debugger and the average number of debug rounds, so the
+    router's thresholds can be tuned. Cancelled jobs are left out.
+    """
+    with _connect() as connection:
+        rows = connection.execute(
+            "SELECT route, COUNT(*), SUM(status = 'succeeded'), SUM(attempts > 1), SUM(MAX(attempts - 1, 0)) "
+            "FROM jobs WHERE status IN ('succeeded', 'failed') AND route IS NOT NULL AND started_at >= ? "
+            "GROUP BY route ORDER BY COUNT(*) DESC",
+            (_since(days),)
+        ).fetchall()
+
+    return [
+        {"route": route, "jobs": jobs, "succeeded": succeeded,
+         "debug_rate": needed_debug / jobs, "avg_debug_rounds": debug_rounds / jobs}
+        for route, jobs, succeeded, needed_debug, debug_rounds in rows
+    ]
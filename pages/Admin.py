@@ -0,0 +1,108 @@
+import hmac
+import os
+import streamlit as st
+from job_history import (
+    debug_attempts_distribution,
+    failure_rate_by_error,
+    job_summary,
+    route_outcomes,
+    stage_latency_percentiles
+)
+
+st.set_page_config(page_title="manimAI · Admin", page_icon="📊", layout="wide")
+
+# Streamlit lists every page under pages/ in the public app's sidebar, so the page only
+# shows anything to visitors who enter ADMIN_TOKEN, and is disabled if it isn't set.
+admin_token = os.environ.get("ADMIN_TOKEN")
+if not admin_token:
+    st.error("The admin page is disabled. Set the ADMIN_TOKEN environment variable to enable it.")
+    st.stop()
+entered_token = st.text_input("Admin token", type = "password")
+if not hmac.compare_digest(entered_token.encode("utf-8"), admin_token.encode("utf-8")):
+    if entered_token:
+        st.error("Wrong admin token.")
+    st.stop()
+
+st.title("📊 Job History")
+
+# The time window every table below is computed over.
+window = st.selectbox(
+    "Time window",
+    ("Last 24 hours", "Last 7 days", "Last 30 days", "All time"),
+    index = 1
+)
+days = {"Last 24 hours": 1, "Last 7 days": 7, "Last 30 days": 30, "All time": None}[window]
+
+# ----------------- Overview -----------------
+summary = job_summary(days)
+cols = st.columns(6)
+cols[0].metric("Jobs", summary["jobs"])
+cols[1].metric("Succeeded", summary["succeeded"])
+cols[2].metric("Failed", summary["failed"])
+cols[3].metric("Cancelled", summary["cancelled"])
+cols[4].metric("Fixed on first attempt", summary["first_attempt"])
+cols[5].metric("Fixed by the Debugger", summary["debugger"])
+
+# ----------------- Latency per stage -----------------
+st.subheader("⏱️ Latency per stage (seconds)")
+latency = stage_latency_percentiles(days)
+if latency:
+    st.dataframe(
+        [
+            {"stage": stage, "count": row["count"], "p50": round(row["p50"], 2),
+             "p95": round(row["p95"], 2), "total": round(row["total"], 1)}
+            for stage, row in sorted(latency.items(), key = lambda item: -item[1]["total"])
+        ],
+        use_container_width = True,
+        hide_index = True
+    )
+else:
+    st.info("No jobs recorded in this window yet.")
+
+# ----------------- Failures -----------------
+left, right = st.columns(2)
+
+with left:
+    st.subheader("💥 Render failures by error type")
+    failures = failure_rate_by_error(days)
+    if failures:
+        st.dataframe(
+            [{**row, "rate": f"{row['rate']:.1%}"} for row in failures],
+            use_container_width = True,
+            hide_index = True
+        )
+    else:
+        st.info("No failed render attempts in this window.")
+
+with right:
+    st.subheader("🔁 Render attempts per job")
+    distribution = debug_attempts_distribution(days)
+    attempt_counts = sorted(set(distribution["succeeded"]) | set(distribution["failed"]))
+    if attempt_counts:
+        st.bar_chart(
+            {
+                "attempts": [str(n) for n in attempt_counts],
+                "succeeded": [distribution["succeeded"].get(n, 0) for n in attempt_counts],
+                "failed": [distribution["failed"].get(n, 0) for n in attempt_counts],
+            },
+            x = "attempts",
+            y = ["succeeded", "failed"]
+        )
+    else:
+        st.info("No finished jobs in this window.")
+
+# ----------------- Router -----------------
+st.subheader("🧭 Prompt router")
+routes = route_outcomes(days)
+if routes:
+    st.dataframe(
+        [
+            {"route": row["route"], "jobs": row["jobs"], "succeeded": row["succeeded"],
+             "debug rate": f"{row['debug_rate']:.1%}", "avg debug rounds": round(row["avg_debug_rounds"], 2)}
+            for row in routes
+        ],
+        use_container_width = True,
+        hide_index = True
+    )
+else:
+    st.info("No finished jobs in this window.")
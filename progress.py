@@ -0,0 +1,71 @@
+# This file defines the progress events the pipeline emits while a job runs, and parses
+# Manim's progress bars into per-frame render progress.
+import re
+from dataclasses import dataclass
+
+# --- Event kinds, in the order a job normally produces them ---
+PLAN_READY = "plan_ready"
+CODE_READY = "code_ready"
+ATTEMPT_STARTED = "attempt_started"
+RENDER_PROGRESS = "render_progress"
+RENDER_STALLED = "render_stalled"
+DEBUG_INVOKED = "debug_invoked"
+DONE = "done"
+FAILED = "failed"
+# Sent when a request is attached to an identical job that is already running.
+JOINED = "joined"
+
+# A render that prints nothing for this long is reported as stalled.
+RENDER_STALL_SECONDS = 60
+
+# Manim prints one progress bar per animation, e.g.
+# "Animation 3: Create(Circle):  47%|####7     | 7/15 [00:00<00:00, 62.81it/s]"
+_MANIM_PROGRESS = re.compile(r"Animation\s+(\d+)\s*:.*?\|\s*(\d+)/(\d+)\b")
+
+
+@dataclass
+class ProgressEvent:
+    """
+    One step of a job's progress. Only the fields that make sense for the event's
+    `kind` are set; `animation` is 0-based, like Manim's own numbering. `quality` is the
+    quality actually being rendered, which may be lower than the one requested.
+    """
+    kind: str
+    message: str
+    attempt: int = None
+    animation: int = None
+    animations: int = None
+    frame: int = None
+    frames: int = None
+    quality: str = None
+
+    @property
+    def fraction(self):
+        """Overall render progress between 0 and 1, or None if it can't be worked out."""
+        if self.kind != RENDER_PROGRESS or not self.frames:
+            return None
+        within = self.frame / self.frames
+        if not self.animations:
+            return within
+        return min(1.0, (self.animation + within) / self.animations)
+
+
+def parse_manim_progress(line: str):
+    """Returns (animation, frame, frames) from a Manim progress-bar line, or None."""
+    match = _MANIM_PROGRESS.search(line)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2)), int(match.group(3))
+
+
+def emit(on_progress, kind: str, message: str, **fields) -> None:
+    """
+    Sends an event to the `on_progress` callback, if there is one. A failing callback
+    is logged and ignored: progress reporting must never break the job itself.
+    """
+    if on_progress is None:
+        return
+    try:
+        on_progress(ProgressEvent(kind, message, **fields))
+    except Exception as e:
+        print(f"--- Progress callback failed: {e}")
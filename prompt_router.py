@@ -0,0 +1,81 @@
+# This file decides, locally and without any LLM call, whether a prompt is simple
+# enough to skip the Planner agent and go straight to a single fused plan+code call.
+import re
+
+ROUTE_FUSED = "fused"       # one LLM call: prompt -> code
+ROUTE_PLANNED = "planned"   # two LLM calls: prompt -> plan -> code
+ROUTE_REUSED = "reused"     # no LLM call: verified code for the same prompt is reused
+
+# --- Thresholds (tune these with the "Prompt router" table on the Admin page) ---
+# Prompts longer than this many words always get a separate plan.
+MAX_SIMPLE_WORDS = 30
+# Prompts that describe more than this many distinct steps always get a separate plan.
+MAX_SIMPLE_STEPS = 2
+# A prompt is routed to the fused call when its complexity score is at most this
+# (and it mentions none of the COMPLEX_KEYWORDS).
+MAX_SIMPLE_SCORE = 2
+
+# Words that signal the animation is a sequence of steps.
+STEP_WORDS = {"then", "next", "after", "afterwards", "finally", "followed", "before", "while", "meanwhile"}
+
+# Topics that, in our experience, need a storyboard to come out right.
+COMPLEX_KEYWORDS = {
+    "3d", "threedscene", "camera", "updater", "updaters", "simulate", "simulation",
+    "neural", "fractal", "recursive", "recursion", "algorithm", "proof", "derive",
+    "derivation", "compare", "comparison", "graph theory", "physics", "projectile",
+    "step-by-step", "step by step",
+}
+
+
+def _count_steps(prompt: str) -> int:
+    """Counts the distinct steps a prompt asks for (sentences, numbered items, step words)."""
+    list_marker = r"(?m)^\s*(?:\d+[.)]|[-*])\s+"
+    numbered_items = len(re.findall(list_marker, prompt))
+    # List markers ("1.") and decimal points ("radius 1.5") don't end a sentence.
+    text = re.sub(list_marker, "", prompt.lower())
+    sentences = [s for s in re.split(r"(?:[;!?\n]|(?<!\d)\.|\.(?!\d))+", text) if s.strip()]
+    # A step word that opens a sentence ("... circle. Then ...") is already counted as
+    # that sentence, so only step words inside a sentence add a step.
+    step_words = 0
+    for sentence in sentences:
+        words = re.findall(r"[a-z]+", sentence)
+        step_words += sum(1 for w in words[1:] if w in STEP_WORDS)
+    return max(numbered_items, len(sentences)) + step_words
+
+
+def classify_prompt(prompt: str) -> dict:
+    """
+    Scores how complex a prompt is using cheap text heuristics.
+
+    Args:
+        prompt: The natural language animation description from the user.
+
+    Returns:
+        A dictionary with the chosen `route`, the `score` and the features behind it
+        (`words`, `steps`, `keywords`), so the decision can be logged and tuned.
+    """
+    lowered = prompt.lower()
+    words = len(lowered.split())
+    steps = _count_steps(prompt)
+    keywords = sorted(k for k in COMPLEX_KEYWORDS if re.search(rf"(?<![a-z0-9]){re.escape(k)}(?![a-z0-9])", lowered))
+
+    score = 0
+    score += words // 10                       # every 10 words adds a point
+    score += max(0, steps - 1)                 # every extra step adds a point
+    score += 2 * len(keywords)                 # known-hard topics weigh more
+
+    # A single known-hard topic is enough to need a storyboard, whatever the score.
+    is_simple = (
+        not keywords
+        and words <= MAX_SIMPLE_WORDS
+        and steps <= MAX_SIMPLE_STEPS
+        and score <= MAX_SIMPLE_SCORE
+    )
+
+    return {
+        "route": ROUTE_FUSED if is_simple else ROUTE_PLANNED,
+        "score": score,
+        "words": words,
+        "steps": steps,
+        "keywords": keywords,
+    }
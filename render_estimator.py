@@ -0,0 +1,244 @@
+# This file estimates how expensive a generated Manim script will be to render,
+# by walking the script's AST instead of running it.
+import ast
+
+# --- Frame rate Manim uses for each quality (matches the "480p15"/"720p30"/... output folders) ---
+QUALITY_FPS = {
+    "480p": 15,
+    "720p": 30,
+    "1080p": 60,
+    "2160p": 60
+}
+
+# --- Rough wall-clock seconds needed to render one frame at each quality ---
+# These are starting guesses, not measurements: compare them with the render-stage
+# latencies in the job history (Admin page) before relying on them to downgrade jobs.
+SECONDS_PER_FRAME = {
+    "480p": 0.02,
+    "720p": 0.05,
+    "1080p": 0.12,
+    "2160p": 0.45
+}
+
+# Extra per-frame cost for every mobject on screen, as a fraction of SECONDS_PER_FRAME.
+MOBJECT_FRAME_COST = 0.02
+
+# Fixed overhead of starting Manim, compiling LaTeX and muxing the video with ffmpeg.
+STARTUP_SECONDS = 4.0
+
+# Manim's defaults when `run_time` / the wait duration is not given.
+DEFAULT_PLAY_SECONDS = 1.0
+DEFAULT_WAIT_SECONDS = 1.0
+
+# Trip count assumed for loops we cannot resolve statically (e.g. `for x in points`, `while`).
+DEFAULT_LOOP_TRIPS = 5
+
+# Qualities from cheapest to most expensive, used when downgrading a job.
+QUALITY_ORDER = ["480p", "720p", "1080p", "2160p"]
+
+
+def _constant_number(node):
+    """Returns the numeric value of a literal AST node (including `-3`), or None."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return float(node.value)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _constant_number(node.operand)
+        if value is not None:
+            return -value if isinstance(node.op, ast.USub) else value
+    return None
+
+
+def _loop_trips(node):
+    """
+    Works out how many times a `for`/`while` loop body runs.
+    Handles `range(...)` with literal arguments and literal lists/tuples;
+    anything else falls back to DEFAULT_LOOP_TRIPS.
+
+    Returns:
+        A tuple (trips, exact) where `exact` is False when the count was guessed.
+    """
+    if isinstance(node, ast.For):
+        iterable = node.iter
+        # Unwrap enumerate(...)/reversed(...), which do not change the trip count.
+        if (isinstance(iterable, ast.Call) and isinstance(iterable.func, ast.Name)
+                and iterable.func.id in ("enumerate", "reversed") and iterable.args):
+            iterable = iterable.args[0]
+
+        if isinstance(iterable, (ast.List, ast.Tuple, ast.Set)):
+            return len(iterable.elts), True
+
+        if isinstance(iterable, ast.Call) and isinstance(iterable.func, ast.Name) and iterable.func.id == "range":
+            values = [_constant_number(arg) for arg in iterable.args]
+            if values and all(v is not None for v in values):
+                if len(values) == 1:
+                    start, stop, step = 0, values[0], 1
+                elif len(values) == 2:
+                    start, stop, step = values[0], values[1], 1
+                else:
+                    start, stop, step = values[0], values[1], values[2]
+                if step == 0:
+                    return 0, True
+                return max(0, int(-(-(stop - start) // step))), True
+
+    return DEFAULT_LOOP_TRIPS, False
+
+
+def _keyword_or_arg(call: ast.Call, name: str, position: int = None):
+    """Finds an argument of a call either by keyword or (if given) by position."""
+    for keyword in call.keywords:
+        if keyword.arg == name:
+            return keyword.value
+    if position is not None and len(call.args) > position and not isinstance(call.args[position], ast.Starred):
+        return call.args[position]
+    return None
+
+
+class _SceneCostVisitor(ast.NodeVisitor):
+    """
+    Walks the body of `construct` and adds up animation time and mobject creations.
+    Every value is multiplied by the trip count of the loops it sits in, and calls to
+    other methods of the scene (`self.helper()`) are followed once per call site.
+    """
+
+    def __init__(self, methods: dict):
+        self.methods = methods
+        self.multiplier = 1
+        self.call_stack = []
+        self.play_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.play_calls = 0
+        self.wait_calls = 0
+        self.mobjects = 0
+        self.unresolved_loops = 0
+
+    def _visit_loop(self, node):
+        trips, exact = _loop_trips(node)
+        if not exact:
+            self.unresolved_loops += 1
+        previous = self.multiplier
+        self.multiplier *= trips
+        for child in node.body:
+            self.visit(child)
+        self.multiplier = previous
+        for child in node.orelse:
+            self.visit(child)
+
+    visit_For = _visit_loop
+    visit_While = _visit_loop
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        is_self_method = (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)
+                          and func.value.id == "self")
+
+        if is_self_method and func.attr == "play":
+            run_time = _keyword_or_arg(node, "run_time")
+            seconds = _constant_number(run_time) if run_time is not None else None
+            self.play_seconds += (seconds if seconds is not None else DEFAULT_PLAY_SECONDS) * self.multiplier
+            self.play_calls += self.multiplier
+
+        elif is_self_method and func.attr == "wait":
+            duration = _keyword_or_arg(node, "duration", 0)
+            seconds = _constant_number(duration) if duration is not None else None
+            self.wait_seconds += (seconds if seconds is not None else DEFAULT_WAIT_SECONDS) * self.multiplier
+            self.wait_calls += self.multiplier
+
+        elif is_self_method and func.attr in self.methods and func.attr not in self.call_stack:
+            # Follow helper methods so work done outside `construct` is still counted.
+            self.call_stack.append(func.attr)
+            for child in self.methods[func.attr].body:
+                self.visit(child)
+            self.call_stack.pop()
+
+        elif isinstance(func, ast.Name) and func.id[:1].isupper():
+            # Manim classes are CamelCase, so `Circle()`, `MathTex(...)` etc. create a mobject.
+            # Animations (`Create(...)`, `Write(...)`) are also counted, which slightly
+            # over-estimates - that is the safe direction for admission control.
+            self.mobjects += self.multiplier
+
+        self.generic_visit(node)
+
+    # Nested function/class definitions do not run where they are defined.
+    def visit_FunctionDef(self, node):
+        pass
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+    visit_ClassDef = visit_FunctionDef
+
+
+def _find_scene_methods(tree: ast.Module, scene_name: str) -> dict:
+    """Returns {method_name: FunctionDef} for the scene class, or {} if it is missing."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ClassDef) and node.name == scene_name:
+            return {
+                item.name: item for item in node.body
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))
+            }
+    return {}
+
+
+def estimate_render_cost(manim_code: str, quality: str, scene_name: str = "GeneratedScene"):
+    """
+    Statically estimates the cost of rendering a Manim script.
+
+    Args:
+        manim_code: The Python script string that will be rendered.
+        quality: One of the keys of QUALITY_FPS ("480p", "720p", ...).
+        scene_name: The scene class to analyse.
+
+    Returns:
+        A dictionary with the predicted `duration_seconds`, `frames`, `mobjects`,
+        `play_calls`, `wait_calls`, `unresolved_loops` and `render_seconds`, or None if the code
+        cannot be parsed or has no `construct` method (the render will fail anyway,
+        so there is nothing useful to estimate).
+    """
+    try:
+        tree = ast.parse(manim_code)
+    except SyntaxError:
+        return None
+
+    methods = _find_scene_methods(tree, scene_name)
+    if "construct" not in methods:
+        return None
+
+    visitor = _SceneCostVisitor(methods)
+    visitor.call_stack.append("construct")
+    for child in methods["construct"].body:
+        visitor.visit(child)
+
+    duration = visitor.play_seconds + visitor.wait_seconds
+    frames = int(round(duration * QUALITY_FPS[quality]))
+    per_frame = SECONDS_PER_FRAME[quality] * (1 + MOBJECT_FRAME_COST * visitor.mobjects)
+
+    return {
+        "quality": quality,
+        "duration_seconds": duration,
+        "frames": frames,
+        "mobjects": visitor.mobjects,
+        "play_calls": visitor.play_calls,
+        "wait_calls": visitor.wait_calls,
+        "unresolved_loops": visitor.unresolved_loops,
+        "render_seconds": STARTUP_SECONDS + frames * per_frame,
+    }
+
+
+def choose_quality_within_budget(manim_code: str, quality: str, budget_seconds: float):
+    """
+    Admission control: keeps the requested quality if the predicted render time fits
+    the budget, otherwise steps down through QUALITY_ORDER until it does.
+
+    Returns:
+        A tuple (quality, estimate). If even the lowest quality exceeds the budget the
+        lowest quality is returned anyway - it is the cheapest thing we can do.
+        If the code cannot be estimated, the requested quality is returned with None.
+    """
+    estimate = estimate_render_cost(manim_code, quality)
+    if estimate is None:
+        return quality, None
+
+    for candidate in reversed(QUALITY_ORDER[:QUALITY_ORDER.index(quality) + 1]):
+        estimate = estimate_render_cost(manim_code, candidate)
+        if estimate["render_seconds"] <= budget_seconds:
+            return candidate, estimate
+
+    return candidate, estimate
@@ -0,0 +1,291 @@
+# This file is the broker between the pipeline and the render workers: the pipeline puts
+# (code, quality, job_id) on a queue and separate worker processes (see render_worker.py)
+# lease jobs, render them and hand back the video.
+#
+# The queue is a SQLite database and results are plain files, so it works on one machine
+# with no outside services. To spread workers over several machines, put RENDER_QUEUE_PATH
+# and RENDER_RESULTS_DIR on storage every machine can reach.
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from cancellation import CancelToken, JobCancelled
+from render_estimator import estimate_render_cost
+
+RENDER_QUEUE_PATH = Path.cwd() / "render_queue.sqlite3"
+RENDER_RESULTS_DIR = Path.cwd() / "render_results"
+
+# A worker owns a job for this long after claiming it or sending a heartbeat.
+LEASE_SECONDS = 60
+# How often workers renew their lease. Must be well below LEASE_SECONDS.
+HEARTBEAT_SECONDS = 10
+# A job whose worker disappeared this many times is failed instead of re-delivered.
+MAX_DELIVERIES = 3
+# Estimate used to order renders whose code can't be estimated. They are likely to need
+# debugging, so they go behind most estimated renders, but still age like every other job.
+UNESTIMATED_RENDER_SECONDS = 10 * 60
+# How often the pipeline checks whether its render has finished.
+RESULT_POLL_SECONDS = 0.5
+# The longest the pipeline waits for a render (queued plus rendering) before failing it,
+# e.g. because no worker is running or every worker keeps crashing.
+RENDER_WAIT_TIMEOUT_SECONDS = 30 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS render_jobs (
+    render_id          TEXT PRIMARY KEY,
+    job_id             TEXT NOT NULL,
+    code               TEXT NOT NULL,
+    quality            TEXT NOT NULL,
+    estimated_seconds  REAL NOT NULL,
+    status             TEXT NOT NULL,      -- 'queued', 'leased', 'succeeded', 'failed' or 'cancelled'
+    worker_id          TEXT,
+    lease_expires_at   REAL,
+    deliveries         INTEGER NOT NULL DEFAULT 0,
+    result_path        TEXT,
+    error              TEXT,
+    created_at         REAL NOT NULL,
+    updated_at         REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS render_jobs_by_status ON render_jobs (status);
+"""
+
+
+class RenderWaitTimeout(RuntimeError):
+    """Raised when no worker finished a render within RENDER_WAIT_TIMEOUT_SECONDS."""
+
+
+# The WAL journal mode is stored in the database file, so setup is only needed once per process.
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+@contextmanager
+def _connect():
+    """
+    Yields a fresh connection in autocommit mode and always closes it. Transactions are
+    opened explicitly (see _transaction) where several statements must be atomic.
+    """
+    global _schema_ready
+    connection = sqlite3.connect(RENDER_QUEUE_PATH, timeout = 30, isolation_level = None)
+    connection.row_factory = sqlite3.Row
+    try:
+        with _schema_lock:
+            if not _schema_ready:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(_SCHEMA)
+                _schema_ready = True
+        yield connection
+    finally:
+        connection.close()
+
+
+@contextmanager
+def _transaction():
+    """
+    Yields a connection inside a write transaction that is committed when the block ends
+    and rolled back on error. BEGIN IMMEDIATE takes the write lock up front, so two
+    workers can't act on the same job.
+    """
+    with _connect() as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+
+# --- Pipeline side ---
+
+def submit_render(render_id: str, job_id: str, manim_code: str, quality: str) -> None:
+    """Puts a render on the queue. `render_id` must be unique per attempt."""
+    estimate = estimate_render_cost(manim_code, quality)
+    now = time.time()
+    with _connect() as connection:
+        connection.execute(
+            "INSERT INTO render_jobs (render_id, job_id, code, quality, estimated_seconds, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+            (render_id, job_id, manim_code, quality,
+             estimate["render_seconds"] if estimate else UNESTIMATED_RENDER_SECONDS, now, now)
+        )
+
+
+def cancel_render(render_id: str) -> None:
+    """Cancels a render that has not finished. Its worker notices on the next heartbeat."""
+    with _connect() as connection:
+        connection.execute(
+            "UPDATE render_jobs SET status = 'cancelled', updated_at = ? WHERE render_id = ? AND status IN ('queued', 'leased')",
+            (time.time(), render_id)
+        )
+
+
+def wait_for_render(render_id: str, cancel_token: CancelToken = None,
+                    timeout: float = RENDER_WAIT_TIMEOUT_SECONDS) -> Path:
+    """
+    Blocks until a worker has finished the render, or `timeout` seconds have passed.
+
+    Returns:
+        The Path of the uploaded video in RENDER_RESULTS_DIR.
+
+    Raises:
+        RuntimeError: If the render failed; contains Manim's error output, like a local render.
+        RenderWaitTimeout: If no worker finished the render in time (the render is failed too).
+        JobCancelled: If `cancel_token` was cancelled while waiting (the render is cancelled too).
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        with _connect() as connection:
+            row = connection.execute(
+                "SELECT status, result_path, error, lease_expires_at FROM render_jobs WHERE render_id = ?",
+                (render_id,)
+            ).fetchone()
+
+        if row is None:
+            raise RuntimeError(f"Render '{render_id}' is not on the queue.")
+        if row["status"] == "succeeded":
+            return Path(row["result_path"])
+        if row["status"] == "failed":
+            raise RuntimeError(row["error"])
+        if row["status"] == "cancelled":
+            raise JobCancelled("The render was cancelled.")
+
+        if cancel_token is not None and cancel_token.is_cancelled:
+            cancel_render(render_id)
+            raise JobCancelled("The job was cancelled while waiting for a render worker.")
+
+        # Workers only reclaim expired leases when they look for work, so if they all
+        # crashed our render would stay 'leased' forever. Reclaim it from here as well.
+        if row["status"] == "leased" and row["lease_expires_at"] < time.time():
+            _reclaim_expired_leases()
+
+        if time.monotonic() > deadline:
+            message = f"No render worker finished the render within {timeout:.0f}s."
+            if _fail_unfinished(render_id, message):
+                raise RenderWaitTimeout(message)
+            continue  # It finished just now; read the final status.
+        time.sleep(RESULT_POLL_SECONDS)
+
+
+def _fail_unfinished(render_id: str, error_message: str) -> bool:
+    """Fails a render that is still queued or leased. Returns False if it had already finished."""
+    with _connect() as connection:
+        cursor = connection.execute(
+            "UPDATE render_jobs SET status = 'failed', error = ?, updated_at = ? "
+            "WHERE render_id = ? AND status IN ('queued', 'leased')",
+            (error_message, time.time(), render_id)
+        )
+    return cursor.rowcount == 1
+
+
+def discard_result(result_path: Path) -> None:
+    """Deletes an uploaded video once the pipeline has copied it to its final location."""
+    if result_path.exists():
+        result_path.unlink()
+
+
+# --- Worker side ---
+
+def _requeue_expired_leases(connection: sqlite3.Connection, now: float) -> None:
+    """Re-delivers jobs whose worker stopped sending heartbeats (it probably crashed)."""
+    connection.execute(
+        "UPDATE render_jobs SET status = 'failed', updated_at = ?, "
+        "error = 'The render worker stopped responding ' || deliveries || ' times; giving up.' "
+        "WHERE status = 'leased' AND lease_expires_at < ? AND deliveries >= ?",
+        (now, now, MAX_DELIVERIES)
+    )
+    connection.execute(
+        "UPDATE render_jobs SET status = 'queued', worker_id = NULL, lease_expires_at = NULL, updated_at = ? "
+        "WHERE status = 'leased' AND lease_expires_at < ?",
+        (now, now)
+    )
+
+
+def _reclaim_expired_leases() -> None:
+    """Runs _requeue_expired_leases in its own write transaction."""
+    with _transaction() as connection:
+        _requeue_expired_leases(connection, time.time())
+
+
+def claim_render(worker_id: str):
+    """
+    Leases the next render for `worker_id`. Shortest predicted renders go first, but every
+    second a job has waited counts as one second off its estimate, so long jobs never starve.
+
+    Returns:
+        A dictionary with `render_id`, `job_id`, `code` and `quality`, or None if the queue is empty.
+    """
+    now = time.time()
+    with _transaction() as connection:
+        _requeue_expired_leases(connection, now)
+        row = connection.execute(
+            "SELECT render_id, job_id, code, quality FROM render_jobs WHERE status = 'queued' "
+            "ORDER BY estimated_seconds - (? - created_at) LIMIT 1",
+            (now,)
+        ).fetchone()
+        if row is not None:
+            connection.execute(
+                "UPDATE render_jobs SET status = 'leased', worker_id = ?, lease_expires_at = ?, "
+                "deliveries = deliveries + 1, updated_at = ? WHERE render_id = ?",
+                (worker_id, now + LEASE_SECONDS, now, row["render_id"])
+            )
+    return dict(row) if row is not None else None
+
+
+def heartbeat(render_id: str, worker_id: str) -> bool:
+    """
+    Renews the worker's lease. Returns False if the worker no longer owns the render
+    (it was cancelled or re-delivered to another worker) and should stop working on it.
+    """
+    now = time.time()
+    with _connect() as connection:
+        cursor = connection.execute(
+            "UPDATE render_jobs SET lease_expires_at = ?, updated_at = ? "
+            "WHERE render_id = ? AND worker_id = ? AND status = 'leased'",
+            (now + LEASE_SECONDS, now, render_id, worker_id)
+        )
+    return cursor.rowcount == 1
+
+
+def complete_render(render_id: str, worker_id: str, video_path: Path) -> bool:
+    """
+    Uploads the rendered video to RENDER_RESULTS_DIR and marks the render as succeeded.
+    Returns False (and keeps no upload) if the worker lost the render in the meantime.
+    """
+    # Don't upload at all if the render was cancelled or re-delivered to another worker.
+    if not heartbeat(render_id, worker_id):
+        return False
+
+    # Every worker uploads under its own name, so a worker that lost its lease can never
+    # overwrite or delete the result of the worker that now owns the render.
+    RENDER_RESULTS_DIR.mkdir(parents = True, exist_ok = True)
+    safe_worker_id = re.sub(r"[^A-Za-z0-9._-]", "_", worker_id)
+    result_path = RENDER_RESULTS_DIR / f"{render_id}-{safe_worker_id}.mp4"
+    # Copy under a temporary name first so the pipeline never sees a half-written file.
+    partial_path = result_path.with_suffix(".partial")
+    shutil.copy(video_path, partial_path)
+    partial_path.replace(result_path)
+
+    with _connect() as connection:
+        cursor = connection.execute(
+            "UPDATE render_jobs SET status = 'succeeded', result_path = ?, updated_at = ? "
+            "WHERE render_id = ? AND worker_id = ? AND status = 'leased'",
+            (str(result_path), time.time(), render_id, worker_id)
+        )
+    if cursor.rowcount != 1:
+        result_path.unlink()  # Our own upload, which nobody else can be using.
+        return False
+    return True
+
+
+def fail_render(render_id: str, worker_id: str, error_message: str) -> None:
+    """Marks a render as failed with Manim's error output, so the pipeline can debug it."""
+    with _connect() as connection:
+        connection.execute(
+            "UPDATE render_jobs SET status = 'failed', error = ?, updated_at = ? "
+            "WHERE render_id = ? AND worker_id = ? AND status = 'leased'",
+            (error_message, time.time(), render_id, worker_id)
+        )
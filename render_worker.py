@@ -0,0 +1,114 @@
+# This file is a render worker: it pulls render jobs from the queue (render_queue.py),
+# renders them with Manim and uploads the result. Start as many as the machine(s) can take:
+#
+#     python render_worker.py [--worker-id NAME]
+#
+# and run the web app with RENDER_BACKEND=queue so it sends renders here.
+import argparse
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from backend_processor import _render_manim_video
+from cancellation import CancelToken, JobCancelled
+from render_queue import (
+    HEARTBEAT_SECONDS,
+    claim_render,
+    complete_render,
+    fail_render,
+    heartbeat
+)
+
+# How long an idle worker waits before looking for new work.
+IDLE_POLL_SECONDS = 1.0
+# How long a worker backs off after the queue database failed (e.g. "database is locked").
+ERROR_BACKOFF_SECONDS = 5.0
+
+
+def _keep_lease(render_id: str, worker_id: str, cancel_token: CancelToken, stop: threading.Event) -> None:
+    """
+    Sends heartbeats while a render runs. If the broker says the render is no longer ours
+    (the user cancelled it, or our lease expired and it went to another worker), the
+    render is cancelled so we stop burning CPU on it.
+    """
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            still_ours = heartbeat(render_id, worker_id)
+        except sqlite3.Error as e:
+            # Probably a busy database; try again next time, before the lease runs out.
+            print(f"--- Worker {worker_id}: Heartbeat for {render_id} failed ({e}).")
+            continue
+        if not still_ours:
+            print(f"--- Worker {worker_id}: Lost render {render_id}, stopping it.")
+            cancel_token.cancel()
+            return
+
+
+def process_one(worker_id: str) -> bool:
+    """
+    Claims and renders a single job. Returns False if the queue was empty.
+    """
+    job = claim_render(worker_id)
+    if job is None:
+        return False
+
+    render_id = job["render_id"]
+    print(f"--- Worker {worker_id}: Rendering {render_id} at '{job['quality']}'.")
+
+    cancel_token = CancelToken()
+    stop_heartbeat = threading.Event()
+    heartbeat_thread = threading.Thread(
+        target = _keep_lease, args = (render_id, worker_id, cancel_token, stop_heartbeat), daemon = True
+    )
+    heartbeat_thread.start()
+
+    # Per worker as well as per render: a re-delivered render may run on two workers at once.
+    media_dir = Path.cwd() / "temp_media" / f"{render_id}-{worker_id}"
+    try:
+        video_path = _render_manim_video(
+            job["code"], attempt = 1, quality = job["quality"],
+            media_dir = media_dir, cancel_token = cancel_token
+        )
+        if not complete_render(render_id, worker_id, video_path):
+            print(f"--- Worker {worker_id}: Render {render_id} was reassigned; result discarded.")
+    except JobCancelled:
+        pass
+    except Exception as e:
+        fail_render(render_id, worker_id, str(e))
+    finally:
+        stop_heartbeat.set()
+        heartbeat_thread.join()
+        if media_dir.exists():
+            shutil.rmtree(media_dir)
+
+    return True
+
+
+def run_worker(worker_id: str) -> None:
+    """Processes jobs forever, sleeping briefly whenever the queue is empty."""
+    print(f"--- Worker {worker_id}: Waiting for render jobs.")
+    while True:
+        try:
+            found_work = process_one(worker_id)
+        except sqlite3.Error as e:
+            # A busy or unreachable queue must not kill the worker; its lease (if any)
+            # simply expires and the render is re-delivered.
+            print(f"--- Worker {worker_id}: Queue error ({e}); retrying in {ERROR_BACKOFF_SECONDS:.0f}s.")
+            time.sleep(ERROR_BACKOFF_SECONDS)
+            continue
+        if not found_work:
+            time.sleep(IDLE_POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Render worker for manimAI.")
+    parser.add_argument(
+        "--worker-id",
+        default = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}",
+        help = "Unique name of this worker (defaults to host, pid and a random suffix)."
+    )
+    run_worker(parser.parse_args().worker_id)
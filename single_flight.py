@@ -0,0 +1,135 @@
+# This file coalesces identical requests that are in flight at the same time: the first
+# request (the leader) runs the job, and identical requests arriving while it runs
+# (followers) wait for it and share its result instead of starting their own job.
+import threading
+import time
+from cancellation import CANCEL_POLL_SECONDS, CancelToken, JobCancelled
+
+# The longest a follower waits for a leader before giving up.
+FOLLOWER_TIMEOUT_SECONDS = 30 * 60
+
+
+class _FlightCancelToken(CancelToken):
+    """
+    The token the shared job runs with. The job is only abandoned once *every*
+    request attached to it has been cancelled; one user leaving must not stop the
+    job for the others who are still waiting.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.participants = []
+
+    @property
+    def is_cancelled(self) -> bool:
+        participants = list(self.participants)
+        return self._event.is_set() or (bool(participants) and all(t.is_cancelled for t in participants))
+
+
+class _Flight:
+    """One running job and everything attached to it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.cancel_token = _FlightCancelToken()
+        self.listeners = []
+        self.result = None
+        self.error = None
+
+    def broadcast(self, event) -> None:
+        """Forwards a progress event from the leader's job to every attached request."""
+        for listener in list(self.listeners):
+            listener(event)
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _detach(flight: _Flight, on_progress = None, cancel_token: CancelToken = None) -> None:
+    """Stops sending a request the flight's progress and, if given, drops its cancel token."""
+    with _flights_lock:
+        if on_progress is not None and on_progress in flight.listeners:
+            flight.listeners.remove(on_progress)
+        if cancel_token is not None and cancel_token in flight.cancel_token.participants:
+            flight.cancel_token.participants.remove(cancel_token)
+
+
+def normalize_key(prompt: str, quality: str) -> tuple:
+    """
+    Identical requests differ at most in whitespace. Case is kept: "the text ABC" or a
+    variable `X` vs `x` asks for a different animation.
+    """
+    return (" ".join(prompt.split()), quality)
+
+
+def run_single_flight(key, job, cancel_token: CancelToken = None, on_progress = None, on_join = None):
+    """
+    Runs `job(cancel_token, on_progress)` unless an identical job (same `key`) is already
+    running, in which case this call waits for that job and returns its result.
+
+    Args:
+        key: Identifies identical requests, e.g. normalize_key(prompt, quality).
+        job: The function doing the work. It receives the shared cancel token and a
+             progress callback that reaches every attached request.
+        cancel_token: Cancels this request. The shared job only stops once every
+                      attached request is cancelled.
+        on_progress: Receives the job's progress events (followers get them from the
+                     moment they attach).
+        on_join: Called with no arguments when this request attaches to a running job.
+
+    Raises:
+        JobCancelled: If this request was cancelled.
+        RuntimeError: If the leader's job failed (followers get its message right away,
+                      without retrying), or a follower waited FOLLOWER_TIMEOUT_SECONDS.
+    """
+    cancel_token = cancel_token or CancelToken()
+    deadline = time.monotonic() + FOLLOWER_TIMEOUT_SECONDS
+
+    while True:
+        with _flights_lock:
+            flight = _flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                _flights[key] = flight
+            flight.cancel_token.participants.append(cancel_token)
+            if on_progress is not None:
+                flight.listeners.append(on_progress)
+
+        if is_leader:
+            try:
+                flight.result = job(flight.cancel_token, flight.broadcast)
+                return flight.result
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                # Forget the flight before waking followers, so a retry starts a fresh job.
+                with _flights_lock:
+                    del _flights[key]
+                flight.done.set()
+
+        print("--- Single-flight: Identical request already running; waiting for its result.")
+        if on_join is not None:
+            on_join()
+
+        # Bounded wait: followers wake as soon as the leader finishes, fails or is abandoned.
+        while not flight.done.wait(CANCEL_POLL_SECONDS):
+            if cancel_token.is_cancelled:
+                # Our cancelled token stays attached: it counts towards "everyone left".
+                _detach(flight, on_progress)
+                cancel_token.raise_if_cancelled()
+            if time.monotonic() > deadline:
+                # We stop waiting without cancelling, so we must not keep the job alive either.
+                _detach(flight, on_progress, cancel_token)
+                raise RuntimeError("Timed out waiting for an identical request that is already running.")
+
+        if flight.error is None:
+            return flight.result
+        if isinstance(flight.error, JobCancelled):
+            # Everyone else left and the job was stopped; if we still want the result,
+            # try again (as the new leader, or attached to a newer identical job).
+            cancel_token.raise_if_cancelled()
+            continue
+        raise RuntimeError(str(flight.error)) from flight.error
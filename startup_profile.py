@@ -0,0 +1,122 @@
+# This file profiles how long the landing page's imports take in a fresh interpreter,
+# and fails if they get over budget or start pulling in heavy libraries again.
+#
+# Usage:  python startup_profile.py [report_path]
+# The full `python -X importtime` report is written to `report_path`
+# (default: importtime_report.txt) so it can be kept as a CI artifact.
+import ast
+import importlib.util
+import subprocess
+import sys
+from pathlib import Path
+
+# The page a fresh server process draws first. frontend.py itself can only be run by
+# Streamlit, so we import everything it imports at the top level instead.
+LANDING_PAGE = "frontend.py"
+
+# Imported by `streamlit run` before it runs the page, so they don't count towards the budget.
+SERVER_MODULES = ["streamlit"]
+
+# Maximum cumulative import time, in milliseconds, for the landing page's imports.
+STARTUP_BUDGET_MS = 250
+
+# Modules that must only be loaded on first use, never at startup.
+LAZY_MODULES = [
+    "backend_processor", "tools", "langchain_openai", "langchain_core", "openai", "dotenv", "numpy", "manim"
+]
+
+# How many of the slowest imports to print.
+TOP_N = 15
+
+SCRIPT_DIR = Path(__file__).parent
+
+# Written to stderr between the server's imports and the page's, to split the report.
+_MARKER = "--- landing page imports start here ---"
+
+
+def _landing_page_imports() -> list:
+    """Returns the modules LANDING_PAGE imports at the top level, in order."""
+    tree = ast.parse((SCRIPT_DIR / LANDING_PAGE).read_text(encoding = "utf-8"))
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return modules
+
+
+def _is_installed(module: str) -> bool:
+    return importlib.util.find_spec(module.split(".")[0]) is not None
+
+
+def _run_importtime(server_modules: list, page_modules: list) -> tuple:
+    """Imports the modules in a fresh interpreter and returns (importtime report, loaded lazy modules)."""
+    probe = "import sys\n"
+    probe += "".join(f"import {module}\n" for module in server_modules)
+    probe += f"sys.stderr.write({_MARKER!r} + '\\n'); sys.stderr.flush()\n"
+    probe += "".join(f"import {module}\n" for module in page_modules)
+    probe += f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))\n"
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd = SCRIPT_DIR,
+        capture_output = True,
+        text = True,
+        encoding = 'utf-8'
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr)
+    loaded = [m for m in process.stdout.strip().split(",") if m]
+    return process.stderr, loaded
+
+
+def _parse_report(report: str) -> list:
+    """Parses `-X importtime` lines into (cumulative_us, self_us, module) tuples."""
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+    return rows
+
+
+def main() -> int:
+    report_path = Path(sys.argv[1]) if len(sys.argv) > 1 else SCRIPT_DIR / "importtime_report.txt"
+
+    page_modules = _landing_page_imports()
+    missing = [m for m in dict.fromkeys(SERVER_MODULES + page_modules) if not _is_installed(m)]
+    if missing:
+        print(f"--- WARNING: not installed, left out of the measurement: {', '.join(missing)}")
+    server_modules = [m for m in SERVER_MODULES if m not in missing]
+    page_modules = [m for m in page_modules if m not in missing]
+
+    report, loaded_lazy = _run_importtime(server_modules, page_modules)
+    report_path.write_text(report, encoding = "utf-8")
+
+    rows = _parse_report(report)
+    page_rows = _parse_report(report.split(_MARKER, 1)[1])
+    # Top-level imports have no leading indentation in the module column, and their
+    # cumulative time already includes everything they import.
+    startup_us = sum(cumulative for cumulative, _, module in page_rows if module == " " + module.strip())
+    startup_ms = startup_us / 1000
+
+    print(f"--- Import-time report written to {report_path}")
+    print(f"--- Slowest {TOP_N} imports (cumulative ms):")
+    for cumulative, _, module in sorted(rows, reverse = True)[:TOP_N]:
+        print(f"{cumulative / 1000:10.1f}  {module.strip()}")
+
+    failed = False
+    print(f"--- {LANDING_PAGE} imports took {startup_ms:.1f} ms (budget {STARTUP_BUDGET_MS} ms).")
+    if startup_ms > STARTUP_BUDGET_MS:
+        print("--- FAILED: startup import time is over budget.")
+        failed = True
+    if loaded_lazy:
+        print(f"--- FAILED: these should be imported lazily but were loaded at startup: {', '.join(loaded_lazy)}")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
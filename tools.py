@@ -1,14 +1,79 @@
 # This file contains all the functions/Agents which will be used to create a animation video from prompt
-import os
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
+import threading
+from example_index import format_examples
+from cancellation import CANCEL_POLL_SECONDS, CancelToken, JobCancelled
+
+# langchain (and the OpenAI client under it) takes seconds to import, so it is loaded
+# the first time an agent actually runs instead of when the web app starts.
+_environment_loaded = False
+
+
+# All cancellable LLM calls run on one long-lived event loop. langchain_openai caches a
+# single httpx.AsyncClient per process, and that client only works on the loop it was first
+# used on; a fresh `asyncio.run(...)` per call fails with "Event loop is closed".
+_llm_loop = None
+_llm_loop_lock = threading.Lock()
+
+
+def _get_llm_loop():
+    """Returns the shared LLM event loop, starting its thread on first use."""
+    global _llm_loop
+    import asyncio
+
+    with _llm_loop_lock:
+        if _llm_loop is None:
+            _llm_loop = asyncio.new_event_loop()
+            threading.Thread(target = _llm_loop.run_forever, name = "manimai-llm-loop", daemon = True).start()
+        return _llm_loop
+
+
+def _ainvoke_cancellable(llm, messages: list, cancel_token: CancelToken):
+    """Runs the LLM request on the shared event loop and cancels it (closing the HTTP request) on cancel."""
+    import asyncio
+    from concurrent.futures import TimeoutError as FutureTimeoutError
+
+    future = asyncio.run_coroutine_threadsafe(llm.ainvoke(messages), _get_llm_loop())
+    while True:
+        try:
+            return future.result(timeout = CANCEL_POLL_SECONDS)
+        except FutureTimeoutError:
+            if cancel_token.is_cancelled:
+                future.cancel()
+                raise JobCancelled("The job was cancelled while waiting for the LLM.")
+
+
+def _invoke_llm(system_prompt: str, user_prompt: str, cancel_token: CancelToken = None, **model_kwargs) -> str:
+    """
+    Sends a system + user message pair to an OpenAI chat model and returns the reply text.
+    `model_kwargs` are passed straight to ChatOpenAI (model name, temperature...).
+    If a `cancel_token` is given, the request is aborted as soon as the token is cancelled.
+    """
+    global _environment_loaded
+    from langchain_openai import ChatOpenAI
+    from langchain_core.messages import SystemMessage, HumanMessage
+
+    if not _environment_loaded:
+        # Reads OPENAI_API_KEY from the .env file.
+        from dotenv import load_dotenv
+        load_dotenv(override = True)
+        _environment_loaded = True
+
+    llm = ChatOpenAI(**model_kwargs)
+    messages = [
+        SystemMessage(content = system_prompt),
+        HumanMessage(content = user_prompt),
+    ]
+
+    if cancel_token is None:
+        response = llm.invoke(messages)
+    else:
+        cancel_token.raise_if_cancelled()
+        response = _ainvoke_cancellable(llm, messages, cancel_token)
+    return response.content
 
-load_dotenv(override = True)
-os.environ.get("OPENAI_API_KEY")
 
 # --- Agent 1: The Planner ---
-def create_animation_plan(user_prompt: str) -> str:
+def create_animation_plan(user_prompt: str, cancel_token: CancelToken = None) -> str:
     """
     Takes a user prompt and asks an LLM to create a detailed, step-by-step animation plan.
     """
@@ -30,21 +95,15 @@ def create_animation_plan(user_prompt: str) -> str:
     **Output Guidelines:**
     To ensure the Coder AI can work effectively, please format your final output as a numbered list titled 'Animation Plan:'. Please focus on the sequence of events and object descriptions, as the Coder AI will handle the specific Manim functions.
     """
-    LLM1 = ChatOpenAI(model = 'gpt-4o-mini', temperature = 0.3)
-    response = LLM1.invoke(
-        [
-            SystemMessage(content = system_prompt),
-            HumanMessage(content = user_prompt),
-        ]
-    )
-    plan = response.content
+    plan = _invoke_llm(system_prompt, user_prompt, cancel_token, model = 'gpt-4o-mini', temperature = 0.3)
     print("--- Planner LLM: Plan created.")
     return plan
 
 # --- Agent 2: The Coder ---
-def create_manim_code(plan: str) -> str:
+def create_manim_code(plan: str, examples: list = None, cancel_token: CancelToken = None) -> str:
     """
     Takes a detailed animation plan and asks an LLM to write the corresponding Manim code.
+    `examples` are verified past examples (see example_index) shown to the LLM as a reference.
     """
 
     system_prompt = """
@@ -67,19 +126,52 @@ def create_manim_code(plan: str) -> str:
     """
 
     user_prompt = f"Based on the following plan, write the Manim code:\n\n{plan}"
-    LLM2 = ChatOpenAI(model = 'gpt-5')
-    response = LLM2.invoke(
-        [
-            SystemMessage(content = system_prompt),
-            HumanMessage(content = user_prompt),
-        ]
-    )
-    code = response.content
+    if examples:
+        user_prompt += (
+            "\n\nFor reference, here is working code written for similar past requests. "
+            f"Reuse its patterns where they fit the plan:\n\n{format_examples(examples)}"
+        )
+    code = _invoke_llm(system_prompt, user_prompt, cancel_token, model = 'gpt-5')
     print("--- Coder LLM: Initial code generated.")
     return code
 
+# --- Agent 2b: The Fused Planner + Coder (used for simple prompts) ---
+def create_manim_code_from_prompt(user_prompt: str, examples: list = None, cancel_token: CancelToken = None) -> str:
+    """
+    Takes a simple user prompt and asks an LLM to plan and write the Manim code in one call,
+    skipping the separate Planner round trip.
+    """
+    system_prompt = """
+    You are a senior Manim programmer and animation director. You will be given a short, simple
+    animation request. Silently decide on a clear sequence of steps for it, then write a complete,
+    runnable Python script that implements those steps.
+
+    **Core Directives:**
+    1.  **Fill Gaps Sensibly:** If the request leaves out details (color, size, duration), make a common-sense choice.
+    2.  **Keep It Focused:** Animate exactly what was asked for. Do not add unrelated scenes or embellishments.
+    3.  **Error Prevention (Crucial):**
+        * **Object Management:** Ensure every object is added to the scene (`self.add()`) *before* it is used in a `Transform` or other animation that assumes it exists.
+        * **Animation Timing:** Use `self.wait()` to create natural pauses between animations, making the final video easy to follow.
+        * **Import Everything:** Start the script with `from manim import *` to ensure all necessary classes and functions are available.
+
+    **Strict Output Rules:**
+    1.  The main animation class **MUST** be named `GeneratedScene`.
+    2.  All animation logic **MUST** be within the `construct(self)` method.
+    3.  Your final output **MUST ONLY** be the raw Python code. Do not include any explanations, comments, or markdown formatting.
+    """
+
+    request = f"Write the Manim code for this animation:\n\n{user_prompt}"
+    if examples:
+        request += (
+            "\n\nFor reference, here is working code written for similar past requests. "
+            f"Reuse its patterns where they fit:\n\n{format_examples(examples)}"
+        )
+    code = _invoke_llm(system_prompt, request, cancel_token, model = 'gpt-5')
+    print("--- Fused Coder LLM: Code generated directly from the prompt.")
+    return code
+
 # --- Agent 3: The Debugger ---
-def debug_manim_code(plan: str, broken_code: str, error_message: str) -> str:
+def debug_manim_code(plan: str, broken_code: str, error_message: str, cancel_token: CancelToken = None) -> str:
     """
     Takes a plan, the code that failed, and the error message, and asks an LLM to fix it.
     """
@@ -118,13 +210,6 @@ def debug_manim_code(plan: str, broken_code: str, error_message: str) -> str:
 
     Please provide the corrected Python code.
     """
-    LLM3 = ChatOpenAI(model = 'gpt-5')
-    response = LLM3.invoke(
-        [
-            SystemMessage(content = system_prompt),
-            HumanMessage(content = user_prompt),
-        ]
-    )
-    corrected_code = response.content
+    corrected_code = _invoke_llm(system_prompt, user_prompt, cancel_token, model = 'gpt-5')
     print("--- Debugger LLM: Code correction attempted.")
     return corrected_code